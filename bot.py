@@ -1,9 +1,9 @@
 # bot.py
 import os
 import asyncio
-import psycopg2
 from dotenv import load_dotenv
 from loguru import logger
+from psycopg2.extras import RealDictCursor
 
 from pipecat.audio.vad.silero import SileroVADAnalyzer
 from pipecat.pipeline.pipeline import Pipeline
@@ -19,7 +19,9 @@ from pipecat.services.openai.stt import OpenAISTTService
 from pipecat.services.openai.llm import OpenAILLMService
 from pipecat.services.elevenlabs.tts import ElevenLabsTTSService
 
-from prompts import base_system_prompt, greeting_text_dict
+from db import DB_POOL_MAX_SIZE, cache_call_context, db_connection, execute_prepared, get_cached_call_context
+from greeting_audio import GreetingAudioCache
+from prompts import render_greeting, render_system_prompt
 
 load_dotenv(override=True)
 
@@ -27,7 +29,22 @@ load_dotenv(override=True)
 # GLOBAL SAFE COMPONENTS
 # -----------------------------------------------------------------------------
 
-GLOBAL_VAD = SileroVADAnalyzer()
+# VAD analyzers carry per-stream state, so calls can't share one instance.
+# Load a few up front (ONNX session init is the slow part) and lend them out.
+VAD_POOL_SIZE = int(os.getenv("VAD_POOL_SIZE", "4"))
+
+_vad_pool: list[SileroVADAnalyzer] = [SileroVADAnalyzer() for _ in range(VAD_POOL_SIZE)]
+
+
+def acquire_vad() -> SileroVADAnalyzer:
+    return _vad_pool.pop() if _vad_pool else SileroVADAnalyzer()
+
+
+def release_vad(vad: SileroVADAnalyzer):
+    # The input transport calls set_sample_rate() on start, which resets the
+    # analyzer's buffers and state for the next call.
+    if len(_vad_pool) < VAD_POOL_SIZE:
+        _vad_pool.append(vad)
 
 GLOBAL_STT = OpenAISTTService(
     api_key=os.getenv("OPENAI_API_KEY"),
@@ -43,51 +60,43 @@ GLOBAL_LLM = OpenAILLMService(
 # DB
 # -----------------------------------------------------------------------------
 
+# ThreadedConnectionPool raises PoolError instead of waiting when it runs dry,
+# so lookups queue here first. One connection is left for /start's writer.
+_db_slots = asyncio.Semaphore(max(1, DB_POOL_MAX_SIZE - 1))
+
+LOAD_CALL_CONTEXT_SQL = """
+    SELECT phone_number, app_name, reason, language, client_name
+    FROM call_contexts
+    WHERE call_sid=$1 AND is_active=TRUE
+    LIMIT 1
+"""
+
 def load_call_context_db(call_sid: str) -> dict:
     try:
-        conn = psycopg2.connect(
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT", "5432"),
-            database=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-        )
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT phone_number, app_name, reason, language, client_name
-            FROM call_contexts
-            WHERE call_sid=%s AND is_active=TRUE
-            """,
-            (call_sid,),
-        )
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
-
-        if not row:
-            return {}
-
-        return dict(
-            phone_number=row[0],
-            app_name=row[1],
-            reason=row[2],
-            language=row[3],
-            client_name=row[4],
-        )
+        with db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            execute_prepared(cur, "load_call_context", LOAD_CALL_CONTEXT_SQL, (call_sid,))
+            row = cur.fetchone()
+
+        return row or {}
 
     except Exception as e:
         logger.error(f"DB load error: {e}")
         return {}
     
 async def load_call_context_async(call_sid: str) -> dict:
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, load_call_context_db, call_sid)
+    ctx = get_cached_call_context(call_sid)
+    if ctx:
+        return ctx
+    async with _db_slots:
+        ctx = await asyncio.to_thread(load_call_context_db, call_sid)
+    if ctx:
+        cache_call_context(call_sid, ctx)
+    return ctx
 
     
 async def wait_for_call_context(call_sid: str, retries: int = 10, delay: float = 0.2) -> dict:
     for _ in range(retries):
-        ctx = load_call_context_db(call_sid)
+        ctx = await load_call_context_async(call_sid)
         if ctx:
             return ctx
         await asyncio.sleep(delay)
@@ -114,108 +123,100 @@ async def bot(runner_args):
         call_sid=call_sid,
     )
 
-    transport = FastAPIWebsocketTransport(
-        websocket=runner_args.websocket,
-        params=FastAPIWebsocketParams(
-            audio_in_enabled=True,
-            audio_out_enabled=True,
-            add_wav_header=False,
-            vad_analyzer=GLOBAL_VAD,
-            serializer=serializer,
-        ),
-    )
-
-    # 🔥 PER-CALL TTS (fixes latency)
-    tts = ElevenLabsTTSService(
-        api_key=os.getenv("ELEVENLABS_API_KEY"),
-        voice_id=os.getenv("ELEVENLABS_VOICE_ID"),
-    )
-
-    lang = call_context.get("language", "hindi")
+    vad = acquire_vad()
+    # Everything past here can fail, and the analyzer has to go back either way
+    try:
 
-    greeting_text = greeting_text_dict.get(lang, greeting_text_dict["hindi"]).format(
-        client_name=call_context.get("client_name", ""),
-        app_name=call_context.get("app_name", ""),
-    )
-    greeting_given = False
+        transport = FastAPIWebsocketTransport(
+            websocket=runner_args.websocket,
+            params=FastAPIWebsocketParams(
+                audio_in_enabled=True,
+                audio_out_enabled=True,
+                add_wav_header=False,
+                vad_analyzer=vad,
+                serializer=serializer,
+            ),
+        )
 
-    system_prompt = base_system_prompt.format(
-        app_name=call_context.get("app_name", ""),
-        reason=call_context.get("reason", ""),
-        language=lang,
-        client_name=call_context.get("client_name", ""),
-    )
+        # 🔥 PER-CALL TTS (fixes latency)
+        tts = ElevenLabsTTSService(
+            api_key=os.getenv("ELEVENLABS_API_KEY"),
+            voice_id=os.getenv("ELEVENLABS_VOICE_ID"),
+        )
 
-    context = LLMContext([{"role": "system", "content": system_prompt}])
-    aggregator = LLMContextAggregatorPair(context)
-
-    transport_input = transport.input()
-    transport_output = transport.output()
-
-    pipeline = Pipeline(
-        [
-            transport_input,
-            GLOBAL_STT,
-            aggregator.user(),
-            GLOBAL_LLM,
-            tts,
-            transport_output,
-            aggregator.assistant(),
-        ]
-    )
+        app_name = call_context.get("app_name") or ""
+        reason = call_context.get("reason") or ""
+        client_name = call_context.get("client_name") or ""
+        lang = call_context.get("language") or "hindi"
+
+        greeting_text = render_greeting(lang, client_name, app_name)
+        system_prompt = render_system_prompt(app_name, reason, lang, client_name)
+
+        context = LLMContext([{"role": "system", "content": system_prompt}])
+        aggregator = LLMContextAggregatorPair(context)
+        greeting = GreetingAudioCache(tts, greeting_text)
+
+        transport_input = transport.input()
+        transport_output = transport.output()
+
+        pipeline = Pipeline(
+            [
+                transport_input,
+                GLOBAL_STT,
+                aggregator.user(),
+                GLOBAL_LLM,
+                tts,
+                greeting,
+                transport_output,
+                aggregator.assistant(),
+            ]
+        )
 
-    task = PipelineTask(
-    pipeline,
-    params=PipelineParams(
-        audio_in_sample_rate=8000,
-        audio_out_sample_rate=8000,
-        enable_metrics=False,
-        enable_usage_metrics=False,
-    ),
-    idle_timeout_secs=None,           # disables idle detection
-    cancel_on_idle_timeout=False,)
-    # -------------------------------------------------------------------------
-    # GREETING (AFTER USER SPEAKS 🔊)
-    # -------------------------------------------------------------------------
-    @task.event_handler("on_pipeline_started")
-    async def on_pipeline_started(task, event):
-        print("on_pipeline_started called")
-        """Wait for user input, then play greeting."""
-        nonlocal greeting_given
-        
-        logger.info("✅ Pipeline started — waiting for user to speak")
-        
-        if not greeting_given:
-            logger.info("✅ Now speaking greeting after user input")
+        task = PipelineTask(
+        pipeline,
+        params=PipelineParams(
+            audio_in_sample_rate=8000,
+            audio_out_sample_rate=8000,
+            enable_metrics=False,
+            enable_usage_metrics=False,
+        ),
+        idle_timeout_secs=None,           # disables idle detection
+        cancel_on_idle_timeout=False,)
+        # -------------------------------------------------------------------------
+        # GREETING (AS SOON AS THE PIPELINE STARTS 🔊)
+        # -------------------------------------------------------------------------
+        async def play_greeting():
             logger.info(f"🎤 Generating greeting: {greeting_text}")
-            
+
             try:
-                # Generate audio from greeting text (tts.run_tts returns an async generator)
-                async for frame in tts.run_tts(text=greeting_text):
-                    logger.info("✅ Greeting audio frame generated, pushing to transport")
-                    # Push each audio frame to the transport output
-                    await transport_output.push_frame(frame)
-                
-                # Add greeting to conversation context so LLM knows bot already greeted
-                context.messages.append({
-                    "role": "assistant",
-                    "content": greeting_text
-                })
-                logger.info("✅ Greeting added to LLM context")
-                greeting_given = True
-                
+                if await greeting.speak():
+                    # Only once it was actually played, so the LLM knows the bot already greeted
+                    context.add_message({"role": "assistant", "content": greeting_text})
+                    logger.info("✅ Greeting added to LLM context")
             except Exception as e:
                 logger.error(f"❌ Error generating greeting: {e}")
-   
-    # -------------------------------------------------------------------------
-    runner = PipelineRunner(handle_sigint=runner_args.handle_sigint)
 
-    try:
-        await runner.run(task)
-    except Exception as e:
-        logger.exception(f"Runner errored for call {call_sid}: {e}")
-    
-        
-    
+        greeting_task: asyncio.Task | None = None
 
-    
+        @task.event_handler("on_pipeline_started")
+        async def on_pipeline_started(task, event):
+            """Play the greeting right away; don't wait for the user to speak first."""
+            nonlocal greeting_task
+
+            logger.info("✅ Pipeline started")
+
+            if greeting_task is None:
+                greeting_task = asyncio.create_task(play_greeting())
+
+        # -------------------------------------------------------------------------
+        runner = PipelineRunner(handle_sigint=runner_args.handle_sigint)
+
+        try:
+            await runner.run(task)
+        except Exception as e:
+            logger.exception(f"Runner errored for call {call_sid}: {e}")
+        finally:
+            if greeting_task and not greeting_task.done():
+                greeting_task.cancel()
+    finally:
+        release_vad(vad)
@@ -1,102 +1,85 @@
-import os
+import argparse
+from contextlib import closing
+
 import psycopg2
-from dotenv import load_dotenv
 
-load_dotenv()
+from db import connect_db, db_connection
 
-# Database connection parameters
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_NAME = os.getenv("DB_NAME")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
+# Create table with sid as primary key and Completed with default value False
+CRM_AI_DB_DDL = """
+CREATE TABLE IF NOT EXISTS "crm-ai-db" (
+    sid VARCHAR(255) PRIMARY KEY,
+    "Completed" BOOLEAN DEFAULT FALSE
+);
+"""
 
-def create_crm_ai_db_table():
-    """Create the crm-ai-db table with sid as primary key and Completed column."""
+# call_sid is the primary key, so lookups already use its unique index.
+# Drop the old duplicate index that only slowed down inserts.
+CALL_CONTEXTS_DDL = """
+CREATE TABLE IF NOT EXISTS call_contexts (
+    call_sid VARCHAR(255) PRIMARY KEY,
+    phone_number VARCHAR(20) NOT NULL,
+    app_name VARCHAR(255),
+    reason TEXT,
+    language VARCHAR(50),
+    client_name VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_active BOOLEAN DEFAULT TRUE
+);
+DROP INDEX IF EXISTS idx_call_contexts_call_sid;
+"""
+
+def _run_ddl(conn, ddl: str, label: str):
+    """Execute `ddl` as a single statement batch."""
     
+    if conn is None:
+        with db_connection() as conn:
+            return _run_ddl(conn, ddl, label)
+
+    # The DDL is idempotent (IF [NOT] EXISTS), so skip the BEGIN/COMMIT
+    # round trips. Postgres still runs a multi-statement query atomically.
+    conn.autocommit = True
     try:
-        # Connect to the database
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD
-        )
-        
-        cursor = conn.cursor()
-        
-        # Create table with sid as primary key and Completed with default value False
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS "crm-ai-db" (
-            sid VARCHAR(255) PRIMARY KEY,
-            "Completed" BOOLEAN DEFAULT FALSE
-        );
-        """
-        
-        cursor.execute(create_table_query)
-        conn.commit()
+        with conn.cursor() as cursor:
+            cursor.execute(ddl)
         
-        print("✅ Table 'crm-ai-db' created successfully!")
-        
-        cursor.close()
-        conn.close()
+        print(f"✅ {label} created successfully!")
         
     except psycopg2.Error as e:
         print(f"❌ Database error: {e}")
     except Exception as e:
         print(f"❌ Error: {e}")
+    finally:
+        # A pooled connection goes back in the default transactional mode
+        conn.autocommit = False
+
+def create_crm_ai_db_table(conn=None):
+    """Create the crm-ai-db table with sid as primary key and Completed column."""
+    _run_ddl(conn, CRM_AI_DB_DDL, "Table 'crm-ai-db'")
 
-def create_call_contexts_table():
+def create_call_contexts_table(conn=None):
     """Create the call_contexts table to store call context data across workers."""
-    
+    _run_ddl(conn, CALL_CONTEXTS_DDL, "Table 'call_contexts'")
+
+def create_all_tables(conn=None):
+    """Create every table in one round trip and one transaction."""
+    _run_ddl(conn, CRM_AI_DB_DDL + CALL_CONTEXTS_DDL, "Tables 'crm-ai-db' and 'call_contexts'")
+
+COMMANDS = {
+    "all": create_all_tables,
+    "crm-ai-db": create_crm_ai_db_table,
+    "call-contexts": create_call_contexts_table,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the bot's database tables.")
+    parser.add_argument("table", nargs="?", default="all", choices=COMMANDS)
+    args = parser.parse_args()
+
+    # One connection for a one-shot run; the pool would open DB_POOL_MIN_SIZE
     try:
-        # Connect to the database
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD
-        )
-        
-        cursor = conn.cursor()
-        
-        # Create call_contexts table
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS call_contexts (
-            call_sid VARCHAR(255) PRIMARY KEY,
-            phone_number VARCHAR(20) NOT NULL,
-            app_name VARCHAR(255),
-            reason TEXT,
-            language VARCHAR(50),
-            client_name VARCHAR(255),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            is_active BOOLEAN DEFAULT TRUE
-        );
-        """
-        
-        cursor.execute(create_table_query)
-        
-        # Create index on call_sid for faster lookups
-        create_index_query = """
-        CREATE INDEX IF NOT EXISTS idx_call_contexts_call_sid ON call_contexts(call_sid);
-        """
-        cursor.execute(create_index_query)
-        
-        conn.commit()
-        
-        print("✅ Table 'call_contexts' created successfully!")
-        
-        cursor.close()
-        conn.close()
-        
+        with closing(connect_db()) as conn:
+            COMMANDS[args.table](conn)
     except psycopg2.Error as e:
         print(f"❌ Database error: {e}")
-    except Exception as e:
-        print(f"❌ Error: {e}")
-
-if __name__ == "__main__":
-    create_crm_ai_db_table()
-    create_call_contexts_table()
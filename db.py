@@ -0,0 +1,185 @@
+# db.py
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+
+from dotenv import load_dotenv
+from loguru import logger
+import psycopg2
+from psycopg2.extensions import connection
+from psycopg2.pool import ThreadedConnectionPool
+
+load_dotenv(override=True)
+
+# -----------------------------------------------------------------------------
+# CONNECTION POOL
+# -----------------------------------------------------------------------------
+
+# Hard cap on concurrent connections / connections kept open between calls.
+# psycopg2 closes any returned connection once DB_POOL_MIN_SIZE are idle, so
+# the min defaults to the max: otherwise every lookup past that concurrency
+# reconnects and re-PREPAREs.
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "8"))
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", str(DB_POOL_MAX_SIZE)))
+
+# Server-side PREPARE is session state, which PgBouncer in transaction pooling
+# mode can't carry between transactions. Set to "false" when DB_PORT points at
+# PgBouncer; statements then go out as plain parameterized queries.
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "true").lower() != "false"
+
+# Fail a connect to an unreachable server instead of hanging the calling thread
+DB_CONNECT_TIMEOUT_SECS = int(os.getenv("DB_CONNECT_TIMEOUT_SECS", "5"))
+
+# Connections that sat in the pool longer than this get a SELECT 1 before use,
+# so one the server dropped in the meantime is replaced instead of failing
+# the caller's query. Busy connections skip the extra round trip.
+DB_POOL_PING_IDLE_SECS = float(os.getenv("DB_POOL_PING_IDLE_SECS", "30"))
+
+
+class _PooledConnection(connection):
+    """psycopg2 connection that remembers which statements it has prepared."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.last_used = time.monotonic()
+
+
+def _connect_kwargs() -> dict:
+    return {
+        "host": os.getenv("DB_HOST"),
+        "port": os.getenv("DB_PORT", "5432"),
+        "database": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "connect_timeout": DB_CONNECT_TIMEOUT_SECS,
+    }
+
+
+def connect_db() -> connection:
+    """Open a single unpooled connection, for one-off scripts."""
+    return psycopg2.connect(**_connect_kwargs())
+
+
+_pool: ThreadedConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_db_pool() -> ThreadedConnectionPool:
+    """Return the process-wide pool, opening it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadedConnectionPool(
+                    DB_POOL_MIN_SIZE,
+                    DB_POOL_MAX_SIZE,
+                    **_connect_kwargs(),
+                    connection_factory=_PooledConnection,
+                )
+                logger.info(
+                    f"✅ DB pool opened (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})"
+                )
+    return _pool
+
+
+def close_db_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            logger.info("DB pool closed")
+
+
+@contextmanager
+def db_connection():
+    """Borrow a pooled connection; commits on success, rolls back on error."""
+    pool = get_db_pool()
+    conn = pool.getconn()
+    if time.monotonic() - conn.last_used > DB_POOL_PING_IDLE_SECS and not _is_alive(conn):
+        # Server restarted or dropped us while idle; swap in a fresh connection
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        conn.last_used = time.monotonic()
+        pool.putconn(conn)
+
+
+def _is_alive(conn) -> bool:
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        # End the probe's implicit transaction so the caller can still change
+        # session settings (e.g. autocommit)
+        conn.rollback()
+        return True
+    except psycopg2.Error as e:
+        logger.warning(f"Dropping dead pooled DB connection: {e}")
+        return False
+
+
+def execute_prepared(cur, name: str, sql: str, params: tuple):
+    """Run `sql` (using $1..$n placeholders) as a server-side prepared statement.
+
+    The statement is PREPAREd the first time a pooled connection sees it, so
+    later calls only ship the parameters and skip parse/plan on the server.
+    """
+    if not DB_PREPARED_STATEMENTS:
+        cur.execute(_positional_to_pyformat(sql), params)
+        return
+
+    conn = cur.connection
+    if name not in conn.prepared:
+        cur.execute(f"PREPARE {name} AS {sql}")
+        conn.prepared.add(name)
+    placeholders = ", ".join(["%s"] * len(params))
+    cur.execute(f"EXECUTE {name} ({placeholders})", params)
+
+
+@lru_cache(maxsize=64)
+def _positional_to_pyformat(sql: str) -> str:
+    """Rewrite $1..$n placeholders as %s (parameters are always passed in order)."""
+    return re.sub(r"\$\d+", "%s", sql)
+
+
+# -----------------------------------------------------------------------------
+# CALL CONTEXT CACHE
+# -----------------------------------------------------------------------------
+
+# In-process TTL cache in front of call_contexts. /start fills it, so when the
+# websocket lands on the same worker the bot skips the Postgres round-trip;
+# otherwise the bot falls back to the table and backfills it.
+CALL_CONTEXT_TTL_SECS = float(os.getenv("CALL_CONTEXT_TTL_SECS", "3600"))
+CALL_CONTEXT_CACHE_SIZE = int(os.getenv("CALL_CONTEXT_CACHE_SIZE", "4096"))
+
+_call_context_cache: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+
+def cache_call_context(call_sid: str, context: dict):
+    _call_context_cache[call_sid] = (time.monotonic() + CALL_CONTEXT_TTL_SECS, context)
+    _call_context_cache.move_to_end(call_sid)
+    if len(_call_context_cache) > CALL_CONTEXT_CACHE_SIZE:
+        _call_context_cache.popitem(last=False)
+
+
+def get_cached_call_context(call_sid: str) -> dict | None:
+    entry = _call_context_cache.get(call_sid)
+    if entry is None:
+        return None
+    expires_at, context = entry
+    if expires_at < time.monotonic():
+        del _call_context_cache[call_sid]
+        return None
+    return context
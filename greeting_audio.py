@@ -0,0 +1,112 @@
+# greeting_audio.py
+import asyncio
+import os
+from collections import OrderedDict
+
+from loguru import logger
+
+from pipecat.frames.frames import (
+    Frame,
+    InterruptionFrame,
+    TTSAudioRawFrame,
+    TTSSpeakFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+# -----------------------------------------------------------------------------
+# GREETING AUDIO CACHE
+# -----------------------------------------------------------------------------
+
+# Repeat calls to the same customer (and greetings without a client name) get
+# the same text, so keep the synthesized audio (LRU) and replay it instead of
+# asking ElevenLabs for it again. Capped by total PCM size per worker: one
+# greeting is ~5s of 8kHz 16-bit audio, about 80-100 KB.
+GREETING_AUDIO_CACHE_MB = float(os.getenv("GREETING_AUDIO_CACHE_MB", "16"))
+
+# How long to wait for the TTS to finish speaking the greeting
+GREETING_TIMEOUT_SECS = 30
+
+_greeting_audio_cache: OrderedDict[str, list[tuple[bytes, int, int]]] = OrderedDict()
+_greeting_audio_bytes = 0
+
+
+def _audio_size(chunks: list[tuple[bytes, int, int]]) -> int:
+    return sum(len(audio) for audio, _, _ in chunks)
+
+
+def _remember_greeting_audio(text: str, chunks: list[tuple[bytes, int, int]]):
+    global _greeting_audio_bytes
+    if text in _greeting_audio_cache:
+        _greeting_audio_bytes -= _audio_size(_greeting_audio_cache.pop(text))
+    _greeting_audio_cache[text] = chunks
+    _greeting_audio_bytes += _audio_size(chunks)
+    while _greeting_audio_bytes > GREETING_AUDIO_CACHE_MB * 1024 * 1024 and _greeting_audio_cache:
+        _, evicted = _greeting_audio_cache.popitem(last=False)
+        _greeting_audio_bytes -= _audio_size(evicted)
+
+
+class GreetingAudioCache(FrameProcessor):
+    """Sits between the TTS service and the output transport.
+
+    The websocket TTS pushes its audio down the pipeline on its own, so this is
+    the one place the greeting's audio can be recorded, and the place to replay
+    it from so it still goes through the output transport.
+    """
+
+    def __init__(self, tts: FrameProcessor, text: str, **kwargs):
+        super().__init__(**kwargs)
+        self._tts = tts
+        self._text = text
+        self._chunks: list[tuple[bytes, int, int]] | None = None
+        self._done: asyncio.Future | None = None
+
+    async def speak(self) -> bool:
+        """Play the greeting; returns True once all of it reached the transport."""
+        cached = _greeting_audio_cache.get(self._text)
+        if cached is not None:
+            _greeting_audio_cache.move_to_end(self._text)
+            logger.info("✅ Greeting audio served from cache")
+            # Pushed from here rather than queued on the task: from the head of
+            # the pipeline the STT would take the audio for caller speech.
+            await self.push_frame(TTSStartedFrame())
+            for audio, sample_rate, num_channels in cached:
+                await self.push_frame(
+                    TTSAudioRawFrame(audio=audio, sample_rate=sample_rate, num_channels=num_channels)
+                )
+            await self.push_frame(TTSStoppedFrame())
+            return True
+
+        self._done = asyncio.get_running_loop().create_future()
+        try:
+            # Straight into this call's TTS: the STT and LLM ahead of it are
+            # shared by every call, so from the head of the pipeline the text
+            # could come out of another call's pipeline.
+            await self._tts.queue_frame(TTSSpeakFrame(self._text))
+            return await asyncio.wait_for(self._done, GREETING_TIMEOUT_SECS)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ Greeting TTS didn't finish in time")
+            return False
+        finally:
+            self._done = None
+            self._chunks = None
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        # Only the greeting is recorded; later (LLM) speech passes straight on
+        if self._done is not None and not self._done.done():
+            if isinstance(frame, TTSStartedFrame):
+                self._chunks = []
+            elif isinstance(frame, TTSAudioRawFrame) and self._chunks is not None:
+                self._chunks.append((frame.audio, frame.sample_rate, frame.num_channels))
+            elif isinstance(frame, TTSStoppedFrame) and self._chunks is not None:
+                if self._chunks:
+                    _remember_greeting_audio(self._text, self._chunks)
+                self._done.set_result(bool(self._chunks))
+            elif isinstance(frame, InterruptionFrame):
+                # The caller talked over the greeting, so the audio is partial
+                self._done.set_result(False)
+
+        await self.push_frame(frame, direction)
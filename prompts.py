@@ -1,15 +1,13 @@
+from functools import lru_cache
 
+# The system prompt is split into a static part and a per-call tail. The static
+# part carries no placeholders, so every call sends a byte-identical prefix and
+# the LLM provider's prompt cache can reuse it; per-call details go last.
 base_system_prompt = (
-    "Respond text strictly in {language} only"
     "IDENTITY & PURPOSE\n"
-    "You are Priya, the customer relationship & support voice assistant for {app_name}, "
+    "You are Priya, the customer relationship & support voice assistant for the app named in CALL CONTEXT, "
     "an international gaming platform offering Casino, सट्टा मटका, and Cricket Exchange.\n\n"
 
-    "CALL CONTEXT (INTERNAL — DO NOT READ ALOUD)\n"
-    "- Client Name: {client_name}\n"
-    "- Reason for Call: {reason}\n"
-    "- Preferred Language: {language}\n\n"
-
     "Your primary goals are:\n"
     "- Politely reconnect with inactive users\n"
     "- Understand reasons for inactivity\n"
@@ -20,7 +18,7 @@ base_system_prompt = (
     "- Ensure a safe, compliant, and friendly experience\n\n"
 
     "LANGUAGE, TONE & BEHAVIOR\n"
-    "- Respond ONLY in the user's preferred language: {language}\n"
+    "- Respond ONLY in the user's preferred language (see CALL CONTEXT)\n"
     "- Auto-detect language ONLY if preferred language is empty\n"
     "- Mix proper English words naturally with the user's language\n"
     "- Tone: Warm, calm, empathetic, non-judgmental\n"
@@ -92,14 +90,23 @@ base_system_prompt = (
     "CLOSING\n"
     "- End politely regardless of outcome.\n"
     "Examples:\n"
-    "  Thank you time देने के लिए — जब भी help चाहिए, {app_name} support available है.\n"
+    "  Thank you time देने के लिए — जब भी help चाहिए, हमारा support available है.\n"
     "  कोई भी issue हो तो app के Help Center से contact कर सकते हैं.\n"
     "  आपका दिन अच्छा रहे — take care.\n\n"
 
     "Important:\n"
     "- Provide only ONE concise response at a time\n"
-    "- Do NOT give multiple variations\n"
-    "- Respond text strictly in {language} only\n"
+    "- Do NOT give multiple variations\n\n"
+)
+
+call_context_prompt = (
+    "CALL CONTEXT (INTERNAL — DO NOT READ ALOUD)\n"
+    "- App Name: {app_name}\n"
+    "- Client Name: {client_name}\n"
+    "- Reason for Call: {reason}\n"
+    "- Preferred Language: {language}\n\n"
+
+    "Respond text strictly in {language} only\n"
 )
 
 
@@ -175,4 +182,28 @@ greeting_text_dict = {
     "danish": "Hej {client_name}! Det er Priya fra {app_name}. Passer det at tale nu?",
     "norwegian": "Hei {client_name}! Dette er Priya fra {app_name}. Passer det å snakke nå?",
     "hebrew": "שלום {client_name}! מדברת פריה מ־{app_name}. האם זה זמן נוח לדבר?"
-}
\ No newline at end of file
+}
+# Fallback template when the call context has no (or an unknown) language
+default_greeting_text = greeting_text_dict["hindi"]
+
+
+# Dial lists repeat the same (app, reason, language, client) tuples, so keep the
+# rendered strings around instead of re-running str.format on every call.
+@lru_cache(maxsize=2048)
+def render_system_prompt(app_name: str, reason: str, language: str, client_name: str) -> str:
+    return base_system_prompt + call_context_prompt.format(
+        app_name=app_name,
+        reason=reason,
+        language=language,
+        client_name=client_name,
+    )
+
+
+@lru_cache(maxsize=2048)
+def render_greeting(language: str, client_name: str, app_name: str) -> str:
+    # Keys are lowercase; callers may send "Hindi" or " english "
+    template = greeting_text_dict.get(language.strip().lower(), default_greeting_text)
+    return template.format(
+        client_name=client_name,
+        app_name=app_name,
+    )
@@ -1,72 +1,142 @@
 # server.py
 import os
+import sys
 import multiprocessing
 import aiohttp
-import psycopg2
 import asyncio
+import orjson
+import psycopg2
 import uvicorn
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
+from urllib.parse import quote_plus, urlencode
 from loguru import logger
+from psycopg2.extras import execute_values
+from pydantic import BaseModel, ConfigDict, Field
 
 from pipecat.runner.types import WebSocketRunnerArguments
 from bot import bot
+from db import cache_call_context, close_db_pool, db_connection, get_db_pool
 
 load_dotenv(override=True)
 
+# Log writes go through a background thread so the event loop never blocks on
+# stderr; LOG_LEVEL=DEBUG brings back the per-frame bot logs. Exceptions log
+# a plain traceback without loguru's variable-by-variable frame inspection.
+logger.remove()
+logger.add(
+    sys.stderr,
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    enqueue=True,
+    backtrace=False,
+    diagnose=False,
+)
+
 # -----------------------------------------------------------------------------
 # DATABASE
 # -----------------------------------------------------------------------------
 
-def get_db_conn():
-    return psycopg2.connect(
-        host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT", "5432"),
-        database=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-    )
-
-def save_call_context_db(call_sid: str, context: dict):
-    try:
-        conn = get_db_conn()
-        cur = conn.cursor()
-
-        cur.execute(
-            """
-            INSERT INTO call_contexts
-            (call_sid, phone_number, app_name, reason, language, client_name, is_active)
-            VALUES (%s,%s,%s,%s,%s,%s,TRUE)
-            ON CONFLICT (call_sid)
-            DO UPDATE SET
-                phone_number = EXCLUDED.phone_number,
-                app_name = EXCLUDED.app_name,
-                reason = EXCLUDED.reason,
-                language = EXCLUDED.language,
-                client_name = EXCLUDED.client_name,
-                updated_at = CURRENT_TIMESTAMP,
-                is_active = TRUE
-            """,
-            (
-                call_sid,
-                context["phone_number"],
-                context["app_name"],
-                context["reason"],
-                context["language"],
-                context["client_name"],
-            ),
+# /start queues call contexts and a single flusher writes them in multi-row
+# upserts: one per burst (up to DB_WRITE_BATCH_SIZE rows) instead of one per call.
+DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", "100"))
+DB_WRITE_INTERVAL_SECS = float(os.getenv("DB_WRITE_INTERVAL_SECS", "0.05"))
+DB_WRITE_QUEUE_SIZE = int(os.getenv("DB_WRITE_QUEUE_SIZE", "10000"))
+
+SAVE_CALL_CONTEXTS_SQL = """
+    INSERT INTO call_contexts
+    (call_sid, phone_number, app_name, reason, language, client_name, is_active)
+    VALUES %s
+    ON CONFLICT (call_sid)
+    DO UPDATE SET
+        phone_number = EXCLUDED.phone_number,
+        app_name = EXCLUDED.app_name,
+        reason = EXCLUDED.reason,
+        language = EXCLUDED.language,
+        client_name = EXCLUDED.client_name,
+        updated_at = CURRENT_TIMESTAMP,
+        is_active = TRUE
+"""
+SAVE_CALL_CONTEXTS_TEMPLATE = "(%s,%s,%s,%s,%s,%s,TRUE)"
+
+def _upsert_call_contexts(rows: list[tuple]):
+    with db_connection() as conn, conn.cursor() as cur:
+        execute_values(
+            cur,
+            SAVE_CALL_CONTEXTS_SQL,
+            rows,
+            template=SAVE_CALL_CONTEXTS_TEMPLATE,
+            page_size=DB_WRITE_BATCH_SIZE,
         )
 
-        conn.commit()
-        cur.close()
-        conn.close()
-        logger.info(f"✅ Saved call context for {call_sid}")
-    except Exception as e:
+def save_call_contexts_db(rows: list[tuple]):
+    try:
+        _upsert_call_contexts(rows)
+        logger.info(f"✅ Saved {len(rows)} call context(s)")
+        return
+    except psycopg2.OperationalError as e:
+        # Connection-level failure; row by row would fail the same way
         logger.error(f"❌ DB error: {e}")
+        return
+    except Exception as e:
+        if len(rows) == 1:
+            logger.error(f"❌ DB error saving call context {rows[0][0]}: {e}")
+            return
+        logger.warning(f"⚠️ Batch of {len(rows)} call contexts failed, retrying row by row: {e}")
+
+    # One bad row fails the whole statement; don't let it sink the others
+    saved = 0
+    for row in rows:
+        try:
+            _upsert_call_contexts([row])
+            saved += 1
+        except Exception as e:
+            logger.error(f"❌ DB error saving call context {row[0]}: {e}")
+    logger.info(f"✅ Saved {saved}/{len(rows)} call context(s)")
+
+async def flush_call_contexts(queue: asyncio.Queue):
+    """Drain `queue` into call_contexts until a None sentinel arrives."""
+    while True:
+        row = await queue.get()
+        if row is None:
+            return
+
+        # Give a burst of /start requests a moment to pile up behind this one
+        await asyncio.sleep(DB_WRITE_INTERVAL_SECS)
+
+        # Keyed by call_sid: one upsert can't touch the same row twice
+        batch = {row[0]: row}
+        stop = False
+        while len(batch) < DB_WRITE_BATCH_SIZE:
+            try:
+                row = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if row is None:
+                stop = True
+                break
+            batch[row[0]] = row
+
+        await asyncio.to_thread(save_call_contexts_db, list(batch.values()))
+        if stop:
+            return
+
+def start_flusher(app: FastAPI):
+    app.state.flusher = asyncio.create_task(flush_call_contexts(app.state.write_q))
+    app.state.flusher.add_done_callback(lambda task: _restart_crashed_flusher(app, task))
+
+def _restart_crashed_flusher(app: FastAPI, task: asyncio.Task):
+    # A dead flusher would leave /start blocked on a full queue, after
+    # Exotel has already dialed
+    if task.cancelled() or task.exception() is None:
+        return
+    logger.opt(exception=task.exception()).error(
+        "❌ call_contexts flusher crashed; its batch is lost, restarting"
+    )
+    start_flusher(app)
 
 # -----------------------------------------------------------------------------
 # FASTAPI
@@ -74,89 +144,178 @@ def save_call_context_db(call_sid: str, context: dict):
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    app.state.http = aiohttp.ClientSession()
+    # Surface Exotel misconfiguration at boot rather than on the first /start
+    if MISSING_ENVS:
+        logger.error(f"❌ Missing Exotel env vars: {', '.join(MISSING_ENVS)}")
+
+    # Keep TLS connections to api.exotel.com warm between /start requests
+    app.state.http = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=100,
+            limit_per_host=32,
+            keepalive_timeout=75,
+            ttl_dns_cache=300,
+        ),
+        # Calls are independent; don't carry Exotel cookies from one to the next
+        cookie_jar=aiohttp.DummyCookieJar(),
+    )
+    # Open the DB pool up front so the first call doesn't pay for the connect
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, get_db_pool)
+    except Exception as e:
+        logger.error(f"❌ DB pool init error: {e}")
+    app.state.write_q = asyncio.Queue(maxsize=DB_WRITE_QUEUE_SIZE)
+    start_flusher(app)
     yield
+    # Write out whatever /start queued before the pool goes away
+    await app.state.write_q.put(None)
+    # A crash here is already logged by _restart_crashed_flusher
+    await asyncio.gather(app.state.flusher, return_exceptions=True)
     await app.state.http.close()
-
-app = FastAPI(lifespan=lifespan)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    close_db_pool()
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Comma-separated list of browser origins allowed to call the API. Exotel and
+# curl don't need CORS at all, so an empty value skips the middleware.
+CORS_ALLOWED_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("CORS_ALLOWED_ORIGINS", "*").split(",")
+    if origin.strip()
+]
+
+if CORS_ALLOWED_ORIGINS:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=CORS_ALLOWED_ORIGINS,
+        allow_methods=["GET", "POST", "OPTIONS"],
+        allow_headers=["content-type", "authorization"],
+        max_age=86400,
+    )
 
 # -----------------------------------------------------------------------------
 # EXOTEL
 # -----------------------------------------------------------------------------
 
-async def make_exotel_call(session, customer_number: str) -> dict:
-    url = f"https://api.exotel.com/v1/Accounts/{os.getenv('EXOTEL_SID')}/Calls/connect"
+# Resolved once at import; /health reports any of these that are missing.
+EXOTEL_API_KEY = os.getenv("EXOTEL_API_KEY")
+EXOTEL_API_TOKEN = os.getenv("EXOTEL_API_TOKEN")
+EXOTEL_SID = os.getenv("EXOTEL_SID")
+EXOTEL_PHONE_NUMBER = os.getenv("EXOTEL_PHONE_NUMBER")
+
+REQUIRED_ENVS = (
+    "EXOTEL_API_KEY",
+    "EXOTEL_API_TOKEN",
+    "EXOTEL_SID",
+    "EXOTEL_PHONE_NUMBER",
+)
+MISSING_ENVS = tuple(env for env in REQUIRED_ENVS if not os.getenv(env))
+
+# The .json suffix makes Exotel answer in JSON instead of XML
+EXOTEL_URL = f"https://api.exotel.com/v1/Accounts/{EXOTEL_SID}/Calls/connect.json"
+EXOTEL_AUTH = (
+    aiohttp.BasicAuth(EXOTEL_API_KEY, EXOTEL_API_TOKEN)
+    if EXOTEL_API_KEY and EXOTEL_API_TOKEN
+    else None
+)
 
-    auth = aiohttp.BasicAuth(
-        os.getenv("EXOTEL_API_KEY"),
-        os.getenv("EXOTEL_API_TOKEN"),
-    )
+# Only "From" changes per call, so the rest of the form body is encoded once
+EXOTEL_STATIC_FORM = urlencode({
+    "CallerId": EXOTEL_PHONE_NUMBER or "",
+    "Url": "http://my.exotel.com/pixelastro1/exoml/start_voice/1136779",
+})
+EXOTEL_FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+EXOTEL_TIMEOUT = aiohttp.ClientTimeout(total=10, connect=3)
 
-    data = {
-        "From": customer_number,
-        "CallerId": os.getenv("EXOTEL_PHONE_NUMBER"),
-        "Url": "http://my.exotel.com/pixelastro1/exoml/start_voice/1136779",
-    }
+class ExotelError(Exception):
+    """Exotel rejected the Connect request or sent back something unusable."""
 
-    async with session.post(url, data=data, auth=auth) as resp:
-        text = await resp.text()
+async def make_exotel_call(session, customer_number: str) -> dict:
+    data = f"From={quote_plus(customer_number)}&{EXOTEL_STATIC_FORM}".encode()
+
+    async with session.post(
+        EXOTEL_URL,
+        data=data,
+        headers=EXOTEL_FORM_HEADERS,
+        auth=EXOTEL_AUTH,
+        timeout=EXOTEL_TIMEOUT,
+    ) as resp:
         if resp.status != 200:
-            raise Exception(text)
+            raise ExotelError(await resp.text())
+
+        # Raw bytes straight into orjson; skips aiohttp's str decode + stdlib json
+        try:
+            call = orjson.loads(await resp.read()).get("Call") or {}
+        except orjson.JSONDecodeError as e:
+            raise ExotelError(f"Invalid Exotel response: {e}")
+
+        if not call.get("Sid"):
+            raise ExotelError(f"Unexpected Exotel response: {call}")
 
         return {
-            "call_sid": text.split("<Sid>")[1].split("</Sid>")[0],
-            "status": text.split("<Status>")[1].split("</Status>")[0],
+            "call_sid": call["Sid"],
+            "status": call.get("Status"),
         }
 
 # -----------------------------------------------------------------------------
 # API
 # -----------------------------------------------------------------------------
 
-@app.post("/start")
-async def initiate_outbound_call(request: Request):
-    data = await request.json()
-    settings = data.get("dialout_settings", {})
+class DialoutSettings(BaseModel):
+    # Exotel takes the number as a string; accept JSON numbers too
+    model_config = ConfigDict(coerce_numbers_to_str=True)
 
-    required_fields = ["app_name", "reason", "language", "client_name", "phone_number"]
-    missing = [f for f in required_fields if not settings.get(f)]
+    # Lengths match the call_contexts columns (see create_db.py)
+    phone_number: str = Field(min_length=1, max_length=20)
+    app_name: str = Field(min_length=1, max_length=255)
+    reason: str = Field(min_length=1)
+    language: str = Field(min_length=1, max_length=50)
+    client_name: str = Field(min_length=1, max_length=255)
 
-    if missing:
-        raise HTTPException(
-            400,
-            f"Missing required dialout_settings fields: {missing}"
-        )
+class StartRequest(BaseModel):
+    dialout_settings: DialoutSettings
 
-    phone_number = settings.get("phone_number")
-    if not phone_number:
-        raise HTTPException(400, "dialout_settings.phone_number is required")
+@app.post("/start")
+async def initiate_outbound_call(body: StartRequest, request: Request):
+    settings = body.dialout_settings
 
-    result = await make_exotel_call(
-        session=request.app.state.http,
-        customer_number=str(phone_number),
-    )
+    try:
+        result = await make_exotel_call(
+            session=request.app.state.http,
+            customer_number=settings.phone_number,
+        )
+    except asyncio.TimeoutError:
+        # The request may have reached Exotel, so the customer can still be
+        # rung even though no call_sid came back
+        logger.error(
+            f"❌ Exotel call timed out after {EXOTEL_TIMEOUT.total}s; "
+            f"{settings.phone_number} may still have been dialed"
+        )
+        raise HTTPException(502, "Exotel call timed out; the call may still have been placed")
+    except (ExotelError, aiohttp.ClientError) as e:
+        logger.error(f"❌ Exotel call failed: {e}")
+        raise HTTPException(502, f"Exotel call failed: {e}")
 
     call_sid = result["call_sid"]
 
     call_context = {
-        "phone_number": phone_number,
-        "app_name": settings.get("app_name"),
-        "reason": settings.get("reason"),
-        "language": settings.get("language"),
-        "client_name": settings.get("client_name"),
+        **settings.model_dump(),
         "call_sid": call_sid,
     }
 
-    loop = asyncio.get_running_loop()
-    loop.run_in_executor(None, save_call_context_db, call_sid, call_context)
+    cache_call_context(call_sid, call_context)
+    await request.app.state.write_q.put(
+        (
+            call_sid,
+            settings.phone_number,
+            settings.app_name,
+            settings.reason,
+            settings.language,
+            settings.client_name,
+        )
+    )
 
-    return JSONResponse(
+    return ORJSONResponse(
         {
             "status": result["status"],
             "call_sid": result["call_sid"],
@@ -185,32 +344,37 @@ async def websocket_endpoint(websocket: WebSocket):
 
 # -----------------------------------------------------------------------------
 
+HEALTH_OK = {
+    "status": "ok",
+    "service": "exotel-outbound-server",
+}
+
 @app.get("/health")
 async def healthcheck():
-    required_envs = [
-        "EXOTEL_API_KEY",
-        "EXOTEL_API_TOKEN",
-        "EXOTEL_SID",
-        "EXOTEL_PHONE_NUMBER",
-    ]
-
-    missing = [env for env in required_envs if not os.getenv(env)]
-
-    if missing:
-        return JSONResponse(
+    if MISSING_ENVS:
+        return ORJSONResponse(
             status_code=500,
-            content={"status": "error", "missing_env_vars": missing},
+            content={"status": "error", "missing_env_vars": list(MISSING_ENVS)},
         )
 
-    return {
-        "status": "ok",
-        "service": "exotel-outbound-server",
-    }
+    return HEALTH_OK
 
 if __name__ == "__main__":
+    # Behind a local reverse proxy, set UVICORN_UDS to a socket path
+    # (e.g. /tmp/uvicorn.sock) to skip the loopback TCP stack; host/port are
+    # ignored when it's set.
+    uds = os.getenv("UVICORN_UDS") or None
+    # Each worker is already concurrent (uvloop + async I/O), so one per core
+    # up to 4 is plenty. Note that --reload can't be combined with workers > 1.
+    workers = int(os.getenv("UVICORN_WORKERS") or min(4, multiprocessing.cpu_count()))
+
     uvicorn.run(
         "server:app",
         host="0.0.0.0",
         port=7862,
-        workers=min(4, multiprocessing.cpu_count()),
+        uds=uds,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        access_log=False,
     )
@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+from pipecat.frames.frames import (
+    EndFrame,
+    TTSAudioRawFrame,
+    TTSSpeakFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+)
+from pipecat.pipeline.pipeline import Pipeline
+from pipecat.pipeline.runner import PipelineRunner
+from pipecat.pipeline.task import PipelineTask
+from pipecat.processors.frame_processor import FrameProcessor
+
+import greeting_audio
+from greeting_audio import GreetingAudioCache
+
+
+@pytest.fixture(autouse=True)
+def empty_greeting_cache(monkeypatch):
+    monkeypatch.setattr(greeting_audio, "_greeting_audio_cache", greeting_audio.OrderedDict())
+    monkeypatch.setattr(greeting_audio, "_greeting_audio_bytes", 0)
+
+
+def greeting_chunks(text: str) -> list[bytes]:
+    return [text.encode(), b"\x00" * 160]
+
+
+class FakeTTS(FrameProcessor):
+    """Stands in for the websocket TTS: it pushes its own audio downstream."""
+
+    def __init__(self, spoken: list[str]):
+        super().__init__()
+        self.spoken = spoken
+
+    async def process_frame(self, frame, direction):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, TTSSpeakFrame):
+            self.spoken.append(frame.text)
+            await self.push_frame(TTSStartedFrame())
+            for chunk in greeting_chunks(frame.text):
+                await self.push_frame(TTSAudioRawFrame(audio=chunk, sample_rate=8000, num_channels=1))
+            await self.push_frame(TTSStoppedFrame())
+        else:
+            await self.push_frame(frame, direction)
+
+
+class PassThrough(FrameProcessor):
+    async def process_frame(self, frame, direction):
+        await super().process_frame(frame, direction)
+        await self.push_frame(frame, direction)
+
+
+class TransportSink(FrameProcessor):
+    """Stands in for the output transport and keeps the audio it receives."""
+
+    def __init__(self):
+        super().__init__()
+        self.audio: list[bytes] = []
+
+    async def process_frame(self, frame, direction):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, TTSAudioRawFrame):
+            self.audio.append(frame.audio)
+        await self.push_frame(frame, direction)
+
+
+async def run_call(spoken: list[str], text: str) -> tuple[bool, list[bytes]]:
+    tts = FakeTTS(spoken)
+    greeting = GreetingAudioCache(tts, text)
+    sink = TransportSink()
+    task = PipelineTask(Pipeline([tts, greeting, sink]))
+    result = {}
+
+    @task.event_handler("on_pipeline_started")
+    async def on_pipeline_started(task, frame):
+        result["spoken"] = await greeting.speak()
+        await task.queue_frame(EndFrame())
+
+    await PipelineRunner(handle_sigint=False).run(task)
+    return result["spoken"], sink.audio
+
+
+def test_second_call_replays_cached_greeting_without_tts():
+    spoken = []
+
+    first = asyncio.run(run_call(spoken, "Namaste Asha ji"))
+    second = asyncio.run(run_call(spoken, "Namaste Asha ji"))
+
+    assert spoken == ["Namaste Asha ji"]
+    assert first == (True, greeting_chunks("Namaste Asha ji"))
+    assert second == (True, greeting_chunks("Namaste Asha ji"))
+
+
+def test_different_greeting_is_synthesized():
+    spoken = []
+
+    asyncio.run(run_call(spoken, "Namaste Asha ji"))
+    asyncio.run(run_call(spoken, "Namaste Ravi ji"))
+
+    assert spoken == ["Namaste Asha ji", "Namaste Ravi ji"]
+
+
+async def run_overlapping_calls(texts: list[str]) -> list[tuple[bool, list[bytes]]]:
+    # Like GLOBAL_STT / GLOBAL_LLM in bot.py: one instance linked into every
+    # call's pipeline, so it forwards to whichever pipeline was built last.
+    shared = PassThrough()
+    calls = []
+    for text in texts:
+        # Each call is up and running before the next one is built
+        tts = FakeTTS([])
+        greeting = GreetingAudioCache(tts, text)
+        sink = TransportSink()
+        # The shared processor also sends the earlier call's CancelFrame on to
+        # the last pipeline, so don't wait long for it at the end.
+        task = PipelineTask(Pipeline([shared, tts, greeting, sink]), cancel_timeout_secs=0.5)
+        started = asyncio.Event()
+        task.add_event_handler("on_pipeline_started", lambda *args, started=started: started.set())
+        runner = asyncio.create_task(PipelineRunner(handle_sigint=False).run(task))
+        await asyncio.wait_for(started.wait(), 5)
+        calls.append((runner, greeting, sink))
+
+    try:
+        spoken = await asyncio.wait_for(
+            asyncio.gather(*(greeting.speak() for _, greeting, _ in calls)), 5
+        )
+    finally:
+        for runner, _, _ in calls:
+            runner.cancel()
+        await asyncio.gather(*(runner for runner, _, _ in calls), return_exceptions=True)
+
+    return [(ok, sink.audio) for ok, (_, _, sink) in zip(spoken, calls)]
+
+
+def test_overlapping_calls_each_hear_their_own_greeting():
+
+    results = asyncio.run(run_overlapping_calls(["Namaste Asha ji", "Namaste Ravi ji"]))
+
+    assert results == [
+        (True, greeting_chunks("Namaste Asha ji")),
+        (True, greeting_chunks("Namaste Ravi ji")),
+    ]
+    assert greeting_audio._greeting_audio_cache == {
+        "Namaste Asha ji": [(chunk, 8000, 1) for chunk in greeting_chunks("Namaste Asha ji")],
+        "Namaste Ravi ji": [(chunk, 8000, 1) for chunk in greeting_chunks("Namaste Ravi ji")],
+    }
+
+
+def test_cache_evicts_oldest_greetings_past_the_size_cap(monkeypatch):
+    monkeypatch.setattr(greeting_audio, "GREETING_AUDIO_CACHE_MB", 2 / 1024)  # 2 KB
+    chunk = [(b"\x00" * 800, 8000, 1)]
+
+    for text in ["Namaste Asha ji", "Namaste Ravi ji", "Namaste Asha ji", "Namaste Meena ji"]:
+        greeting_audio._remember_greeting_audio(text, chunk)
+
+    assert list(greeting_audio._greeting_audio_cache) == ["Namaste Asha ji", "Namaste Meena ji"]
+    assert greeting_audio._greeting_audio_bytes == 1600